@@ -1,8 +1,21 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import requests
-import altair as alt
+import gzip
+import os
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.regions import AFRICA, EU
+from src.frames import downcast_frame
 
 st.set_page_config(page_title="Food Import Risk Dashboard", layout="wide")
 st.title("Food Import Risk Dashboard")
@@ -22,25 +35,329 @@ SHOCK_URLS = {
 }
 
 
+# Columns the tables, charts and drilldown actually use.
+# Everything else in the parquet files is dropped right after loading.
+RISK_COLS = ["country", "commodity", "risk_score", "risk_band"]
+SHOCK_COLS = [
+    "country", "commodity", "year",
+    "shortfall_abs", "shortfall_pct",
+    "apparent_consumption", "consumption_shocked",
+    "import_dependency_ratio",
+]
+
+
+# Low-cardinality text columns kept as pandas categoricals after loading
+CATEGORY_COLS = ["country", "commodity", "risk_band"]
+
+# Measures coerced to numbers once, when a file is decoded
+NUMERIC_COLS = [
+    "shortfall_abs", "shortfall_pct", "risk_score",
+    "import_dependency_ratio", "apparent_consumption", "consumption_shocked",
+]
+
+# Tonnes stay float64 when the rest is narrowed: the drilldown shows them
+# unrounded, and add_shortfall_abs subtracts two of them
+FLOAT64_COLS = ["shortfall_abs", "apparent_consumption", "consumption_shocked"]
+
+
+# Display dtypes: Arrow-backed strings and narrow numbers,
+# so st.dataframe hands Arrow buffers over without per-value conversion
+DISPLAY_DTYPES = {
+    "country": "string[pyarrow]",
+    "commodity": "string[pyarrow]",
+    "risk_band": "string[pyarrow]",
+    "year": "Int32",
+    "risk_score": "float32",
+    "shortfall_abs_m": "float32",
+    "shortfall_pct": "float32",
+    "import_dependency_ratio": "float32",
+}
+
+
+# Vega-Lite specs for the two bar charts.
+# Plain dicts passed to st.vega_lite_chart: no Altair schema build per rerun.
+EXPOSURE_CHART_SPEC = {
+    "height": 420,
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "shortfall_abs_m", "type": "quantitative", "title": "Shortfall (million tonnes)"},
+        "y": {"field": "country", "type": "nominal", "sort": "-x"},
+        "color": {"field": "risk_band", "type": "nominal", "title": "Risk band"},
+        "tooltip": [
+            {"field": "country", "type": "nominal"},
+            {"field": "shortfall_abs_m", "type": "quantitative"},
+            {"field": "risk_band", "type": "nominal"},
+        ],
+    },
+}
+
+COMPARE_CHART_SPEC = {
+    "height": 420,
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "shortfall_diff_m", "type": "quantitative", "title": "Change in shortfall (million tonnes)"},
+        "y": {"field": "country", "type": "nominal", "sort": "-x"},
+        "color": {"field": "risk_band_b", "type": "nominal", "title": "Risk band (shock B)"},
+    },
+}
+
+
 # Helpers
-@st.cache_data(ttl=24 * 3600, show_spinner=True)
-def load_parquet(url: str) -> pd.DataFrame:
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    One HTTP session shared across reruns and users.
+    Keeps the connection to GitHub alive so each file download
+    skips a fresh TCP + TLS handshake.
+    """
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=8,
+            max_retries=Retry(total=3, backoff_factor=0.5),
+        ),
+    )
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    return session
+
+
+# Download cache windows (seconds).
+# Fresh files are served as is; stale ones are served while a refresh runs.
+CACHE_TTL = 24 * 3600
+CACHE_STALE_WHILE_REVALIDATE_TTL = 24 * 3600
+
+
+# Downloaded files are mirrored here so a server restart starts warm
+DOWNLOAD_DIR = Path(os.environ.get("DOWNLOAD_CACHE_DIR", "~/.streamlit/cache/downloads")).expanduser()
+
+
+def _disk_path(url: str) -> Path:
+    return DOWNLOAD_DIR / url.rsplit("/", 1)[-1]
+
+
+def _etag_path(url: str) -> Path:
+    path = _disk_path(url)
+    return path.with_suffix(path.suffix + ".etag")
+
+
+def _load_from_disk(url: str, cache: dict) -> tuple[bytes, float] | None:
+    # fetched_at is the file mtime, so decoded frames persisted under it still match
+    path = _disk_path(url)
+    try:
+        entry = (path.read_bytes(), path.stat().st_mtime)
+    except OSError:
+        return None
+    try:
+        etag_path = _etag_path(url)
+        cache["etags"][url] = etag_path.read_text().strip()
+        # the sidecar is touched on every 304, so its mtime is the last validation
+        cache["checked"][url] = etag_path.stat().st_mtime
+    except OSError:
+        pass
+    return entry
+
+
+def _save_to_disk(url: str, content: bytes, etag: str | None) -> float:
+    path = _disk_path(url)
+    try:
+        DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        if etag:
+            _etag_path(url).write_text(etag)
+        else:
+            _etag_path(url).unlink(missing_ok=True)
+        return path.stat().st_mtime
+    except OSError:
+        # disk mirror is best effort, the in-memory copy is enough to serve
+        return time.time()
+
+
+def _touch_etag(url: str) -> None:
+    try:
+        os.utime(_etag_path(url))
+    except OSError:
+        pass
+
+
+@st.cache_resource
+def get_download_cache() -> dict:
+    """
+    Downloaded files shared across reruns and users.
+    files: url -> (content, fetched_at)
+    etags: url -> ETag of the cached content
+    checked: url -> last time a conditional GET confirmed the content
+    refreshing: urls with a background refresh in flight
+    pending: url -> Future of a first download started by prefetch_downloads
+    """
+    return {
+        "files": {}, "etags": {}, "checked": {}, "refreshing": set(), "pending": {},
+        "lock": threading.Lock(),
+    }
+
+
+@st.cache_resource
+def get_refresh_pool() -> ThreadPoolExecutor:
+    # one worker per release file, so a cold prefetch runs fully in parallel
+    return ThreadPoolExecutor(max_workers=5)
+
+
+def _refresh_file(url: str, cache: dict, session: requests.Session) -> tuple[bytes, float]:
+    try:
+        entry = cache["files"].get(url)
+        etag = cache["etags"].get(url)
+        headers = {"If-None-Match": etag} if (entry is not None and etag) else None
+
+        # Read the body straight off the socket into one bytes object
+        with session.get(url, timeout=120, stream=True, headers=headers) as r:
+            if r.status_code == 304:
+                # unchanged: keep bytes and fetched_at, so decoded frames stay cached
+                cache["checked"][url] = time.time()
+                _touch_etag(url)
+                return entry
+            r.raise_for_status()
+            content = r.raw.read(decode_content=True)
+            etag = r.headers.get("ETag")
+
+        entry = (content, _save_to_disk(url, content, etag))
+        cache["files"][url] = entry
+        cache["checked"][url] = entry[1]
+        if etag:
+            cache["etags"][url] = etag
+        else:
+            cache["etags"].pop(url, None)
+        return entry
+    finally:
+        with cache["lock"]:
+            cache["refreshing"].discard(url)
+        cache["pending"].pop(url, None)
+
+
+def _refresh_in_background(url: str, cache: dict, session: requests.Session) -> None:
+    try:
+        _refresh_file(url, cache, session)
+    except requests.RequestException:
+        # keep serving the stale copy, the next stale hit will retry
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def prefetch_downloads(urls: tuple[str, ...]) -> None:
+    """
+    Start downloading every release file at once, the first time the
+    app runs, so later shock selections don't wait on the network.
+    fetch_bytes picks up the pending download instead of starting another.
+    """
+    cache = get_download_cache()
+    session = get_session()
+    pool = get_refresh_pool()
+    for url in urls:
+        if url in cache["files"]:
+            continue
+        entry = _load_from_disk(url, cache)
+        if entry is not None:
+            cache["files"][url] = entry
+            continue
+        with cache["lock"]:
+            cache["refreshing"].add(url)
+        cache["pending"][url] = pool.submit(_refresh_file, url, cache, session)
+
+
+def fetch_bytes(url: str) -> tuple[bytes, float]:
+    """
+    Stale-while-revalidate download.
+      - validated within CACHE_TTL: return cached bytes
+      - inside the stale window: return cached bytes, revalidate in background
+      - older or missing: download now (blocking)
+    Revalidation is a conditional GET; a 304 keeps the cached bytes.
+    Returns (content, fetched_at).
+    """
+    cache = get_download_cache()
+    session = get_session()
+    entry = cache["files"].get(url)
+    # .get(): the worker pops its own entry from pending when it finishes
+    fut = cache["pending"].get(url) if entry is None else None
+    if fut is not None:
+        try:
+            return fut.result()
+        except requests.RequestException:
+            pass
+    if entry is None:
+        entry = _load_from_disk(url, cache)
+        if entry is not None:
+            cache["files"][url] = entry
+
+    if entry is not None:
+        age = time.time() - cache["checked"].get(url, entry[1])
+        if age < CACHE_TTL:
+            return entry
+        if age < CACHE_TTL + CACHE_STALE_WHILE_REVALIDATE_TTL:
+            with cache["lock"]:
+                start = url not in cache["refreshing"]
+                cache["refreshing"].add(url)
+            if start:
+                get_refresh_pool().submit(_refresh_in_background, url, cache, session)
+            return entry
+
+    return _refresh_file(url, cache, session)
+
+
+@st.cache_data(show_spinner=False, max_entries=32, persist="disk")
+def _read_parquet(
+    url: str,
+    fetched_at: float,
+    columns: tuple[str, ...] | None,
+    filters: tuple | None,
+    _content: bytes,
+) -> pd.DataFrame:
+    # keyed by (url, fetched_at, columns, filters): a refreshed download gets decoded again.
+    # BufferReader wraps the bytes without the extra copy BytesIO makes.
+    if columns is not None:
+        # only decode the requested columns (missing ones are skipped)
+        names = pq.read_schema(pa.BufferReader(_content)).names
+        columns = [c for c in columns if c in names]
+    table = pq.read_table(
+        pa.BufferReader(_content),
+        columns=columns,
+        filters=list(filters) if filters else None,
+    )
+    df = table.to_pandas()
+
+    # parquet normally stores these as numbers already; coerce only if it didn't
+    df = downcast_frame(df, numeric_cols=NUMERIC_COLS, keep_float64=FLOAT64_COLS)
+
+    # categoricals: isin / == / groupby / merge work on int codes
+    for c in CATEGORY_COLS:
+        if c in df.columns:
+            df[c] = df[c].astype("category")
+    return df
+
+
+def load_parquet(url: str, columns: list[str] | None = None, filters: tuple | None = None) -> pd.DataFrame:
     """
     Download parquet over HTTP and load into pandas.
-    Cached in Streamlit so it won't re-download constantly.
+    Bytes come from the stale-while-revalidate cache, so an expired
+    file never blocks a rerun while its refresh is in flight.
+    Only `columns` are decoded when given; `filters` (pyarrow filter
+    tuples) let the reader skip row groups that can't match.
     """
-    r = requests.get(url, timeout=120)
-    r.raise_for_status()
-    return pd.read_parquet(BytesIO(r.content))
+    content, fetched_at = fetch_bytes(url)
+    return _read_parquet(url, fetched_at, tuple(columns) if columns else None, filters, content)
 
 
 def add_shortfall_abs(df: pd.DataFrame) -> pd.DataFrame:
     if "shortfall_abs" not in df.columns:
         if "apparent_consumption" in df.columns and "consumption_shocked" in df.columns:
-            df["shortfall_abs"] = (
-                pd.to_numeric(df["apparent_consumption"], errors="coerce").fillna(0)
-                - pd.to_numeric(df["consumption_shocked"], errors="coerce").fillna(0)
-            ).clip(lower=0)
+            # One pass over two float64 buffers instead of pandas temporaries
+            a = safe_num(df["apparent_consumption"]).to_numpy(dtype=np.float64, na_value=np.nan, copy=True)
+            b = safe_num(df["consumption_shocked"]).to_numpy(dtype=np.float64, na_value=np.nan)
+            a[np.isnan(a)] = 0.0
+            np.subtract(a, np.where(np.isnan(b), 0.0, b), out=a)
+            np.maximum(a, 0.0, out=a)
+            df["shortfall_abs"] = a
     return df
 
 
@@ -48,6 +365,35 @@ def safe_num(s):
     return pd.to_numeric(s, errors="coerce")
 
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def df_to_csv_gz_bytes(df: pd.DataFrame) -> bytes:
+    """
+    Gzipped CSV export for the download button.
+    Cached on the table content, so reruns don't re-serialize it.
+    compresslevel=1: a Top-N table shrinks to a few KB at any level.
+    """
+    buf = BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=1) as gz:
+        df.to_csv(gz, index=False, encoding="utf-8")
+    return buf.getvalue()
+
+
+def for_display(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype({c: t for c, t in DISPLAY_DTYPES.items() if c in df.columns})
+
+
+def as_float32(s) -> np.ndarray:
+    return safe_num(s).to_numpy(dtype=np.float32, na_value=np.nan)
+
+
+def to_millions(s) -> np.ndarray:
+    """
+    Tonnes -> million tonnes, rounded to 2 dp.
+    One float32 multiply + round on the raw array.
+    """
+    return np.round(as_float32(s) * np.float32(1e-6), 2)
+
+
 def safe_sort(df: pd.DataFrame, by: list[str], ascending: list[bool] | None = None) -> pd.DataFrame:
     """
     Sort only by columns that exist AND have at least one non-null value.
@@ -74,34 +420,63 @@ def safe_sort(df: pd.DataFrame, by: list[str], ascending: list[bool] | None = No
     return df.sort_values(cols, ascending=orders, na_position="last")
 
 
+def load_risk() -> pd.DataFrame:
+    return load_parquet(RISK_URL, RISK_COLS)
+
+
+@st.cache_resource(max_entries=2)
+def _risk_lookup(url: str, fetched_at: float) -> pd.DataFrame:
+    # one indexed copy per downloaded version of the risk file
+    return load_risk().set_index(["country", "commodity"])[["risk_score", "risk_band"]]
+
+
+def risk_lookup() -> pd.DataFrame:
+    """
+    Risk index keyed by (country, commodity), shared across reruns and users.
+    """
+    _, fetched_at = fetch_bytes(RISK_URL)
+    return _risk_lookup(RISK_URL, fetched_at)
+
+
+def attach_risk(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add risk_score / risk_band to each (country, commodity) row.
+    Many-to-one lookup by reindexing the indexed risk table: no hash join.
+    """
+    lookup = risk_lookup()
+    keys = pd.MultiIndex.from_arrays([df["country"], df["commodity"]])
+    return df.assign(
+        risk_score=lookup["risk_score"].reindex(keys).to_numpy(),
+        risk_band=lookup["risk_band"].reindex(keys).to_numpy(),
+    )
+
+
+# Fetch the risk index and all shock files together on a cold start
+prefetch_downloads((RISK_URL, *SHOCK_URLS.values()))
+
 # Load core data
 with st.spinner("Loading risk index..."):
-    risk = load_parquet(RISK_URL)
-
-# Region lists (simple)
-AFRICA = {
-    "Nigeria", "Egypt", "Algeria", "Morocco", "Tunisia", "Kenya", "Ethiopia",
-    "Ghana", "Senegal", "South Africa"
-}
-EU = {
-    "Germany", "France", "Italy", "Spain", "Netherlands", "Belgium",
-    "Poland", "Portugal", "Greece", "Austria", "Sweden", "Finland"
-}
+    risk = load_risk()
 
 
-def apply_region(df: pd.DataFrame, region: str) -> pd.DataFrame:
-    if df.empty or "country" not in df.columns:
-        return df
+def shock_filters(region: str, commodity: str) -> tuple | None:
+    """
+    Region / commodity selection as parquet filters for the shock files.
+    """
+    filters = []
     if region == "Africa":
-        return df[df["country"].isin(AFRICA)].copy()
-    if region == "EU":
-        return df[df["country"].isin(EU)].copy()
-    return df
+        filters.append(("country", "in", tuple(sorted(AFRICA))))
+    elif region == "EU":
+        filters.append(("country", "in", tuple(sorted(EU))))
+    if commodity != "All":
+        filters.append(("commodity", "==", commodity))
+    return tuple(filters) or None
 
 
 # Commodities from risk index
 if "commodity" in risk.columns:
-    all_commodities = sorted(risk["commodity"].dropna().unique().tolist())
+    # categories are the sorted, non-null distinct values
+    all_commodities = risk["commodity"].cat.categories.tolist()
 else:
     all_commodities = []
 
@@ -122,67 +497,59 @@ with st.sidebar:
         shock_b = st.selectbox("Compare with", choices)
 
     commodities = ["All"] + all_commodities
+    # options are the risk categories themselves, so the pick is already canonical
     commodity = st.selectbox("Commodity", commodities, index=0)
 
     n = st.slider("Top N results", 5, 200, 20, 5)
 
 
 # Load shock parquet
-def load_shock_df(shock_pct: float) -> pd.DataFrame:
+def load_shock_df(shock_pct: float, region: str = "All", commodity: str = "All") -> pd.DataFrame:
     url = SHOCK_URLS[shock_pct]
-    df = load_parquet(url)
-    df = add_shortfall_abs(df)
-    return df
-
+    # risk_score / risk_band come from the risk index, not the shock file
+    df = load_parquet(url, SHOCK_COLS, filters=shock_filters(region, commodity))
+    return add_shortfall_abs(df)
 
-with st.spinner("Loading shock simulation file(s)..."):
-    sim_a = load_shock_df(shock_a)
-
-sim_b = pd.DataFrame()
-if compare_mode and shock_b is not None:
-    with st.spinner("Loading comparison shock file..."):
-        sim_b = load_shock_df(shock_b)
 
+@st.cache_data(ttl=300, show_spinner=False)
+def get_enriched(shock_pct: float, region: str = "All", commodity: str = "All") -> pd.DataFrame:
+    """
+    Shock rows with risk attached, numerics coerced and shortfall in millions.
+    None of this depends on Top N, so it runs once per (shock, region, commodity).
+    """
+    df = load_shock_df(shock_pct, region, commodity)
+    if df.empty:
+        return df
 
-# Build top table
-def build_top(sim_df: pd.DataFrame) -> pd.DataFrame:
-    if sim_df is None or sim_df.empty:
-        return pd.DataFrame()
+    # Risk score per simulation row
+    df = attach_risk(df)
 
-    # Merge risk score into simulation rows (be defensive: risk might miss cols)
-    risk_cols = [c for c in ["country", "commodity", "risk_score", "risk_band"] if c in risk.columns]
-    if "country" in sim_df.columns and "commodity" in sim_df.columns and set(["country", "commodity"]).issubset(risk_cols):
-        df = sim_df.merge(
-            risk[risk_cols],
-            on=["country", "commodity"],
-            how="left"
-        )
+    # numeric columns were already coerced by _read_parquet
+    # Shortfall in millions only if shortfall_abs exists
+    if "shortfall_abs" in df.columns:
+        df["shortfall_abs_m"] = to_millions(df["shortfall_abs"])
     else:
-        df = sim_df.copy()
+        df["shortfall_abs_m"] = pd.NA
+    return df
 
-    # Filters
-    df = apply_region(df, region)
 
-    if commodity != "All" and "commodity" in df.columns:
-        df = df[df["commodity"].astype(str).str.lower() == str(commodity).lower()].copy()
+# Shock B only in compare mode; shock A is loaded by the Top-N table and the drilldown.
+# Every shock file is already being downloaded by prefetch_downloads.
+sim_b = pd.DataFrame()
+if compare_mode and shock_b is not None:
+    with st.spinner("Loading shock simulation file..."):
+        sim_b = get_enriched(shock_b)
 
-    # Ensure numeric
-    for col in ["shortfall_abs", "shortfall_pct", "risk_score", "import_dependency_ratio", "apparent_consumption"]:
-        if col in df.columns:
-            df[col] = safe_num(df[col])
 
-    # Safe sort biggest absolute shortfall first
-    df = safe_sort(
-        df,
-        by=["shortfall_abs", "risk_score", "apparent_consumption"],
-        ascending=[False, False, False]
-    ).head(n)
+# Build top table
+def build_top(df: pd.DataFrame, n: int) -> pd.DataFrame:
+    """
+    Rank an enriched, already region/commodity-filtered shock frame.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame()
 
-    # Shortfall in millions only if shortfall_abs exists
-    if "shortfall_abs" in df.columns:
-        df["shortfall_abs_m"] = (safe_num(df["shortfall_abs"]) / 1_000_000).round(2)
-    else:
-        df["shortfall_abs_m"] = pd.NA
+    sort_cols = ["shortfall_abs", "risk_score", "apparent_consumption"]
 
     # Table columns
     preferred = [
@@ -193,10 +560,41 @@ def build_top(sim_df: pd.DataFrame) -> pd.DataFrame:
         "year"
     ]
     preferred = [c for c in preferred if c in df.columns]
-    return df[preferred].copy()
 
+    # Project first, so the ranking only carries the columns it returns
+    cols = preferred + [c for c in sort_cols if c in df.columns and c not in preferred]
+    df = df[cols]
+
+    # Safe sort biggest absolute shortfall first (NaN keys last).
+    # Not nlargest: with several keys it can return more than n rows on NaN ties.
+    df = safe_sort(df, by=sort_cols, ascending=[False, False, False]).head(n)
+    return for_display(df[preferred])
 
-df_a = build_top(sim_a)
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_top(shock_pct: float, region: str, commodity: str, n: int) -> pd.DataFrame:
+    """
+    Top table for one shock, filtered by region and commodity.
+    Cached on these scalar inputs, so switching a filter back is free.
+    """
+    # region / commodity filters are applied while reading the parquet
+    return build_top(get_enriched(shock_pct, region, commodity), n)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_country_options(shock_pct: float, region: str, commodity: str, n: int) -> list[str]:
+    """
+    Sorted countries of one top table (the drilldown choices).
+    Same cache key as load_top, so the unique + sort runs once per table.
+    """
+    df = load_top(shock_pct, region, commodity, n)
+    if df.empty or "country" not in df.columns:
+        return []
+    # category conversion yields the sorted, non-null distinct values
+    return df["country"].astype("category").cat.categories.tolist()
+
+
+df_a = load_top(shock_a, region, commodity, n)
 
 
 # Top metrics
@@ -214,21 +612,28 @@ if compare_mode:
     if df_a.empty or sim_b.empty:
         st.warning("No records to compare. Try a different region/commodity/shock.")
     else:
-        df_b_top = build_top(sim_b)
+        # Only A's (country, commodity) pairs survive the inner merge,
+        # so shape just those rows of B instead of ranking all of it
+        pairs = pd.MultiIndex.from_frame(df_a[["country", "commodity"]].astype(str))
+        in_a = pd.MultiIndex.from_arrays([sim_b["country"], sim_b["commodity"]]).isin(pairs)
+        df_b_rows = build_top(sim_b[in_a], int(in_a.sum()))
 
         merged = df_a.merge(
-            df_b_top,
+            df_b_rows,
             on=["country", "commodity"],
             suffixes=("_a", "_b"),
             how="inner"
-        )
+        ) if not df_b_rows.empty else pd.DataFrame()
 
         if merged.empty:
             st.warning("No overlapping country+commodity pairs found for comparison.")
         else:
-            merged["shortfall_diff_m"] = (
-                safe_num(merged.get("shortfall_abs_m_b")) - safe_num(merged.get("shortfall_abs_m_a"))
-            ).round(2)
+            # Both sides are float32 already (build_top casts them): subtract
+            # and round in place on one owned buffer, no to_numeric pass
+            a = merged["shortfall_abs_m_a"].to_numpy(dtype=np.float32, na_value=np.nan)
+            diff = merged["shortfall_abs_m_b"].to_numpy(dtype=np.float32, na_value=np.nan, copy=True)
+            np.subtract(diff, a, out=diff)
+            merged["shortfall_diff_m"] = np.round(diff, 2, out=diff)
 
             view_cols = [c for c in [
                 "country", "commodity",
@@ -245,18 +650,17 @@ if compare_mode:
             st.dataframe(view, use_container_width=True)
 
             if "shortfall_diff_m" in view.columns and "country" in view.columns:
-                chart = (
-                    alt.Chart(view)
-                    .mark_bar()
-                    .encode(
-                        x=alt.X("shortfall_diff_m:Q", title="Change in shortfall (million tonnes)"),
-                        y=alt.Y("country:N", sort="-x"),
-                        color=alt.Color("risk_band_b:N", title="Risk band (shock B)") if "risk_band_b" in view.columns else alt.value("steelblue"),
-                        tooltip=[c for c in ["country", "commodity", "shortfall_diff_m", "risk_band_b"] if c in view.columns]
-                    )
-                    .properties(height=420)
-                )
-                st.altair_chart(chart, use_container_width=True)
+                # Only the encoded columns go into the chart spec sent to the browser
+                chart_cols = [c for c in ["country", "commodity", "shortfall_diff_m", "risk_band_b"] if c in view.columns]
+                encoding = dict(COMPARE_CHART_SPEC["encoding"])
+                if "risk_band_b" not in view.columns:
+                    encoding["color"] = {"value": "steelblue"}
+                encoding["tooltip"] = [
+                    {"field": c, "type": "quantitative" if c == "shortfall_diff_m" else "nominal"}
+                    for c in chart_cols
+                ]
+                spec = {**COMPARE_CHART_SPEC, "encoding": encoding}
+                st.vega_lite_chart(view[chart_cols], spec, use_container_width=True)
 
     st.divider()
 
@@ -272,25 +676,34 @@ else:
 
     # Chart 
     if all(c in df_a.columns for c in ["country", "risk_band", "shortfall_abs_m"]):
-        chart_df = (
-            df_a.groupby(["country", "risk_band"], as_index=False)
-                .agg(shortfall_abs_m=("shortfall_abs_m", "sum"))
+        # (country, risk_band) sums via bincount on the categorical codes
+        country_cat = df_a["country"].astype("category").cat
+        band_cat = df_a["risk_band"].astype("category").cat
+        cc = country_cat.codes.to_numpy()
+        bc = band_cat.codes.to_numpy()
+        w = as_float32(df_a["shortfall_abs_m"]).astype(np.float64)
+
+        # rows with a missing key drop out, like groupby's dropna
+        ok = (cc >= 0) & (bc >= 0)
+        nb = len(band_cat.categories)
+        keys = cc[ok].astype(np.int64) * nb + bc[ok]
+        sums = np.bincount(
+            keys,
+            weights=np.where(np.isnan(w[ok]), 0.0, w[ok]),
+            minlength=len(country_cat.categories) * nb,
         )
-        chart_df["shortfall_abs_m"] = safe_num(chart_df["shortfall_abs_m"])
+
+        # observed cells, in first-appearance order
+        cells, first = np.unique(keys, return_index=True)
+        cells = cells[np.argsort(first, kind="stable")]
+        chart_df = pd.DataFrame({
+            "country": country_cat.categories.take(cells // nb),
+            "risk_band": band_cat.categories.take(cells % nb),
+            "shortfall_abs_m": sums[cells],
+        })
         chart_df = safe_sort(chart_df, by=["shortfall_abs_m"], ascending=[False])
 
-        chart = (
-            alt.Chart(chart_df)
-            .mark_bar()
-            .encode(
-                x=alt.X("shortfall_abs_m:Q", title="Shortfall (million tonnes)"),
-                y=alt.Y("country:N", sort="-x"),
-                color=alt.Color("risk_band:N", title="Risk band"),
-                tooltip=["country", "shortfall_abs_m", "risk_band"]
-            )
-            .properties(height=420)
-        )
-        st.altair_chart(chart, use_container_width=True)
+        st.vega_lite_chart(chart_df, EXPOSURE_CHART_SPEC, use_container_width=True)
 
 
 # Country Drilldown
@@ -298,57 +711,68 @@ st.divider()
 st.subheader("Country Drilldown")
 st.caption("Pick a country from the current results and see its risk across commodities.")
 
-countries = sorted(df_a["country"].dropna().unique().tolist()) if (not df_a.empty and "country" in df_a.columns) else []
-if not countries:
-    st.info("No country names available for drilldown.")
-else:
-    country_selected = st.selectbox("Select a country", countries)
+@st.cache_data(ttl=300, show_spinner=False)
+def load_drilldown(shock_pct: float, country: str) -> pd.DataFrame:
+    """
+    All commodities of one country under one shock.
+    Cached per (shock, country), so switching back to a country is free.
+    """
+    sim = get_enriched(shock_pct)
+    drill = sim[sim["country"] == country] if ("country" in sim.columns) else pd.DataFrame()
+    if drill.empty:
+        return drill
 
-    drill = sim_a[sim_a["country"] == country_selected].copy() if ("country" in sim_a.columns) else pd.DataFrame()
+    # the enriched frame already has risk joined and shortfall in millions
+    cols = [
+        "country", "commodity",
+        "risk_score", "risk_band",
+        "import_dependency_ratio",
+        "shortfall_pct", "shortfall_abs_m",
+        "apparent_consumption",
+        "consumption_shocked",
+        "year"
+    ]
+    cols = [c for c in cols if c in drill.columns]
+    drill = drill[cols].copy()
+
+    # Safe sort drilldown (THIS fixes your ValueError)
+    drill = safe_sort(drill, by=["shortfall_abs_m", "risk_score"], ascending=[False, False])
+    return for_display(drill)
+
+
+@st.fragment
+def drilldown(countries: list[str], shock_pct: float) -> None:
+    """
+    Country drilldown as a fragment: picking a country reruns only this
+    block, not the downloads, top table and charts above it.
+    """
+    if not countries:
+        st.info("No country names available for drilldown.")
+        return
+
+    country_selected = st.selectbox("Select a country", countries)
 
+    drill = load_drilldown(shock_pct, country_selected)
     if drill.empty:
         st.info("No drilldown records found for this selection.")
-    else:
-        # Join risk index
-        risk_cols = [c for c in ["country", "commodity", "risk_score", "risk_band"] if c in risk.columns]
-        if set(["country", "commodity"]).issubset(drill.columns) and set(["country", "commodity"]).issubset(risk_cols):
-            drill = drill.merge(
-                risk[risk_cols],
-                on=["country", "commodity"],
-                how="left"
-            )
-
-        drill = add_shortfall_abs(drill)
-
-        # Shortfall in millions
-        if "shortfall_abs" in drill.columns:
-            drill["shortfall_abs_m"] = (safe_num(drill["shortfall_abs"]) / 1_000_000).round(2)
-        else:
-            drill["shortfall_abs_m"] = pd.NA
+        return
 
-        cols = [
-            "country", "commodity",
-            "risk_score", "risk_band",
-            "import_dependency_ratio",
-            "shortfall_pct", "shortfall_abs_m",
-            "apparent_consumption",
-            "consumption_shocked",
-            "year"
-        ]
-        cols = [c for c in cols if c in drill.columns]
-        drill = drill[cols].copy()
+    st.dataframe(drill, use_container_width=True)
 
-        # Safe sort drilldown (THIS fixes your ValueError)
-        drill = safe_sort(drill, by=["shortfall_abs_m", "risk_score"], ascending=[False, False])
 
-        st.dataframe(drill, use_container_width=True)
+drilldown(load_country_options(shock_a, region, commodity, n), shock_a)
 
 
-# Download
-if not df_a.empty:
+# Download (fragment: a click doesn't rerun the whole page)
+@st.fragment
+def download_csv(df_a: pd.DataFrame, shock_a: float, commodity: str) -> None:
     st.download_button(
-        "Download CSV (current table)",
-        df_a.to_csv(index=False).encode("utf-8"),
-        file_name=f"top_shock_{int(shock_a*100)}_{commodity}.csv",
-        mime="text/csv",
+        "Download CSV (current table, gzipped)",
+        df_to_csv_gz_bytes(df_a),
+        file_name=f"top_shock_{int(shock_a*100)}_{commodity}.csv.gz",
+        mime="application/gzip",
     )
+
+
+if not df_a.empty:
+    download_csv(df_a, shock_a, commodity)
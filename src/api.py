@@ -2,16 +2,60 @@
 # This API is optional and not used in the Streamlit Cloud deployment.
 # The live dashboard loads parquet files directly from GitHub Releases.
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
+from functools import lru_cache
 from src.simulate import simulate_import_shock
+from src.regions import REGIONS
+from src.frames import downcast_frame
 import re
 import os
+import hashlib
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import NamedTuple
 
-app = FastAPI(title="Food Import Risk API", version="1.0")
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON rendered by orjson in C; numpy scalars/arrays and NaN (-> null) handled natively.
+    Routes return it directly so FastAPI's jsonable_encoder walk is skipped too.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Load the parquets before the first request instead of on it
+    try:
+        _load_all()
+    except RuntimeError as e:
+        # keep serving /health and /docs; data routes will raise the same error
+        print(f">>> warmup skipped: {e}")
+    yield
+
+
+app = FastAPI(
+    title="Food Import Risk API",
+    version="1.0",
+    default_response_class=ORJSONResponse,
+    lifespan=_lifespan,
+)
+
+# Compress JSON responses for clients sending Accept-Encoding: gzip
+# (large /risk/top payloads shrink several times over the wire)
+app.add_middleware(GZipMiddleware, minimum_size=1000)
 print(">>> LOADED src/api.py VERSION = 2026-01-18 A <<<")
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -22,73 +66,304 @@ BASE_FILE = PROCESSED / "base_country_commodity_year.parquet"
 SIM_FILE  = PROCESSED / "shock_simulation_latest_importdrop20.parquet"
 SIM35_FILE = PROCESSED / "shock_simulation_latest_importdrop35.parquet"
 
-_RISK = None
-_BASE = None
-_SIM = None
+# Columns the endpoints actually use; everything else stays on disk
+_RISK_COLS = [
+    "country", "commodity",
+    "risk_score", "risk_band",
+    "mean_idr", "prod_vol_norm", "import_vol_norm",
+]
+_BASE_COLS = [
+    "country", "commodity", "year",
+    "production_qty", "import_qty", "export_qty",
+    "apparent_consumption", "import_dependency_ratio",
+]
+_SIM_COLS = [
+    "country", "commodity",
+    "shortfall_pct", "consumption_shocked",
+    "flag_zero_consumption_after_shock",
+]
+_CACHED_COLS = [
+    "country", "commodity",
+    "risk_score", "risk_band",
+    "mean_idr", "prod_vol_norm", "import_vol_norm",
+    "year",
+    "production_qty", "import_qty", "export_qty",
+    "apparent_consumption", "import_dependency_ratio",
+    "shortfall_pct", "shortfall_abs",
+    "consumption_shocked", "idr_shocked",
+    "flag_zero_consumption_after_shock",
+]
+
+# Shortfall inputs; coerced to numbers once at load if a file stores them as text
+_SHORTFALL_INPUTS = ["apparent_consumption", "consumption_shocked"]
+
+_KEYS = ["country", "commodity"]
+
+
+class _Loaded(NamedTuple):
+    """
+    Everything built from one load of the data files. A request takes one
+    snapshot and uses it throughout, so a reload never mixes generations.
+    """
+    risk: pd.DataFrame
+    base_latest: pd.DataFrame
+    # same frames indexed by [country, commodity], used as right sides of joins
+    risk_idx: pd.DataFrame
+    base_latest_idx: pd.DataFrame
+    sim_idx: pd.DataFrame
+    # {country_lc: row positions} for the frames _country_match runs on
+    risk_rows: dict[str, np.ndarray]
+    base_latest_rows: dict[str, np.ndarray]
+    # /meta lists
+    commodities: list[str]
+    countries: list[tuple[str, str]]  # (country, lowercased), sorted, special areas removed
+
+
+_LOADED: _Loaded | None = None
+_LOADED_MTIMES = None
+_LOAD_LOCK = threading.Lock()
 
 
 # Helpers
-def _load_all():
-    global _RISK, _BASE, _SIM
+def _file_mtimes() -> tuple:
+    return tuple(p.stat().st_mtime_ns if p.exists() else None for p in [RISK_FILE, BASE_FILE, SIM_FILE])
+
+
+def _load_all() -> _Loaded:
+    global _LOADED, _LOADED_MTIMES
+
+    mtimes = _file_mtimes()
+    if _LOADED is not None and mtimes == _LOADED_MTIMES:
+        return _LOADED
+
+    with _LOAD_LOCK:
+        if _LOADED is not None and mtimes == _LOADED_MTIMES:
+            return _LOADED
 
-    if _RISK is None or _BASE is None or _SIM is None:
         missing = [p for p in [RISK_FILE, BASE_FILE, SIM_FILE] if not p.exists()]
         if missing:
             raise RuntimeError(f"Missing required files: {[str(m) for m in missing]}")
 
-        _RISK = pd.read_parquet(RISK_FILE)
-        _BASE = pd.read_parquet(BASE_FILE)
-        _SIM  = pd.read_parquet(SIM_FILE)
+        # the three reads overlap: Arrow releases the GIL while decoding
+        with ThreadPoolExecutor(max_workers=3) as ex:
+            risk, base, sim = ex.map(
+                lambda args: _read_parquet(*args),
+                [(RISK_FILE, _RISK_COLS), (BASE_FILE, _BASE_COLS), (SIM_FILE, _SIM_COLS)],
+            )
+
+        risk, base, sim = _shared_categories([risk, base, sim], ["country", "commodity"])
+
+        # latest year per (country, commodity), built once instead of per request;
+        # idxmax is a single pass over the groups, no global sort on year.
+        # Rows without a year are dropped first: idxmax raises on an all-NaN group.
+        dated = base[base["year"].notna()]
+        latest_idx = dated.groupby(["country", "commodity"], observed=True)["year"].idxmax()
+        base_latest = base.loc[latest_idx].reset_index(drop=True)
+
+        # only the frames _country_match runs on get the lowercased column
+        risk = _with_country_lc(risk)
+        base_latest = _with_country_lc(base_latest)
+        countries = pd.DataFrame({"country": risk["country"].dropna().unique().tolist()})
+
+        # join keys hashed once here instead of on every request
+        loaded = _Loaded(
+            risk=risk,
+            base_latest=base_latest,
+            risk_idx=risk.drop(columns="country_lc").set_index(_KEYS),
+            base_latest_idx=base_latest.drop(columns="country_lc").set_index(_KEYS),
+            sim_idx=sim.set_index(_KEYS),
+            risk_rows=risk.groupby("country_lc", sort=False).indices,
+            base_latest_rows=base_latest.groupby("country_lc", sort=False).indices,
+            commodities=sorted(risk["commodity"].dropna().unique().tolist()),
+            countries=[(c, c.lower()) for c in sorted(_filter_special_areas(countries)["country"].tolist())],
+        )
+
+        # publish in one step: the snapshot is complete before anyone sees it
+        _LOADED, _LOADED_MTIMES = loaded, mtimes
+
+    return _LOADED
+
+
+def _shared_categories(frames: list[pd.DataFrame], cols: list[str]) -> list[pd.DataFrame]:
+    """
+    Converts key columns to category dtype with one category set across frames,
+    so groupby / merge on [country, commodity] run on int codes and merges
+    between the frames keep the categorical join path.
+    """
+    for c in cols:
+        values = pd.concat([pd.Series(df[c].dropna().unique()) for df in frames if c in df.columns])
+        dtype = pd.CategoricalDtype(sorted(values.unique()))
+        for df in frames:
+            if c in df.columns:
+                df[c] = df[c].astype(dtype)
+    return frames
+
+
+def _read_parquet(path: Path, columns: list[str]) -> pd.DataFrame:
+    """
+    Reads only the listed columns (those missing from the file are skipped),
+    so unused column chunks are never decompressed.
+    """
+    names = set(pq.read_schema(path).names)
+    df = pd.read_parquet(path, columns=[c for c in columns if c in names], engine="pyarrow")
+
+    # ints only: every float goes back out as JSON rounded to 6 dp (quantities
+    # in tonnes, ratios, scores) or into simulate_import_shock, and float32
+    # already changes those digits
+    return downcast_frame(df, numeric_cols=_SHORTFALL_INPUTS, keep_float64=df.columns)
 
-    return _RISK, _BASE, _SIM
 
+def _with_country_lc(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds country_lc (lowercased country) once at load time,
+    so _country_match doesn't lowercase the whole column per request.
+    """
+    if "country" in df.columns:
+        df["country_lc"] = df["country"].str.lower()
+    return df
 
-def _round_floats(records: list[dict], decimals: int = 6) -> list[dict]:
-    out = []
-    for r in records:
-        rr = {}
-        for k, v in r.items():
-            if isinstance(v, (float, np.floating)) and pd.notna(v):
-                rr[k] = round(float(v), decimals)
-            else:
-                rr[k] = v
-        out.append(rr)
+
+def _rounded(df: pd.DataFrame, decimals: int = 6) -> pd.DataFrame:
+    """
+    Float columns rounded in bulk, with NaN turned into None for JSON.
+    """
+    num_cols = df.select_dtypes(include=[np.floating]).columns
+    if len(num_cols) == 0:
+        return df
+    out = df.copy()
+    rounded = out[num_cols].round(decimals)
+    out[num_cols] = rounded.astype(object).where(rounded.notna(), None)
     return out
 
 
-def _country_match(df: pd.DataFrame, country: str) -> pd.DataFrame:
+def _records(df: pd.DataFrame, decimals: int = 6) -> list[dict]:
+    return _rounded(df, decimals).to_dict(orient="records")
+
+
+def _rows_payload(df: pd.DataFrame, orient: str = "records", decimals: int = 6) -> dict:
+    """
+    Rows for a response, in one of two layouts:
+      records -> {"records": [{col: value, ...}, ...]}
+      columns -> {"columns": {col: [values, ...]}}
+    The columnar layout can go straight into pd.DataFrame(...) on the client,
+    with no per-row dtype inference.
+    """
+    if orient == "columns":
+        return {"columns": _rounded(df, decimals).to_dict(orient="list")}
+
+    return {"records": _records(df, decimals=decimals)}
+
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def _wants_arrow(request: Request) -> bool:
+    return ARROW_STREAM in request.headers.get("accept", "")
+
+
+def _arrow_response(df: pd.DataFrame) -> Response:
+    """
+    Rows as an Arrow IPC stream, for clients sending Accept: application/vnd.apache.arrow.stream.
+    Read with pa.ipc.open_stream(body).read_all(): no JSON parse, no dtype inference.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(content=sink.getvalue().to_pybytes(), media_type=ARROW_STREAM)
+
+
+def _etag_json(request: Request, payload: dict) -> Response:
+    """
+    JSON response tagged with a content hash (ETag).
+    If the client sends a matching If-None-Match, reply 304 with no body
+    so it can reuse the copy it already has.
+    """
+    resp = ORJSONResponse(payload)
+    etag = '"' + hashlib.sha1(resp.body).hexdigest() + '"'
+
+    sent = request.headers.get("if-none-match", "")
+    if etag in [t.strip().removeprefix("W/") for t in sent.split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    resp.headers["ETag"] = etag
+    return resp
+
+
+def _country_match(df: pd.DataFrame, country: str, rows: dict[str, np.ndarray] | None = None) -> pd.DataFrame:
+    """
+    Rows for one country: exact (case-insensitive) match, else substring match.
+    rows is the frame's {country_lc: row positions} from _Loaded, if it has one.
+    """
     q = country.strip().lower()
 
-    # exact match first
-    exact = df[df["country"].str.lower() == q]
-    if not exact.empty:
-        return exact.copy()
+    # exact match first: hash lookup on the loaded frames, column compare otherwise
+    if rows is not None:
+        pos = rows.get(q)
+        if pos is not None:
+            return df.iloc[pos].drop(columns="country_lc", errors="ignore")
 
-    # partial match fallback
-    contains = df[df["country"].str.lower().str.contains(q, na=False)]
-    return contains.copy()
+    lc = df["country_lc"] if "country_lc" in df.columns else df["country"].str.lower()
+    if rows is None:
+        exact = df[lc == q]
+        if not exact.empty:
+            return exact.drop(columns="country_lc", errors="ignore")
+
+    # partial match fallback (plain substring, no regex)
+    contains = df[lc.str.contains(q, na=False, regex=False)]
+    return contains.drop(columns="country_lc", errors="ignore")
 
 
 def _add_shortfall_abs(df: pd.DataFrame) -> pd.DataFrame:
     """
     Adds absolute shortfall = apparent_consumption - consumption_shocked.
+    Inputs are already numeric (_read_parquet coerces them once at load)
+    and are subtracted in float64; missing values count as 0.
     """
     if "apparent_consumption" in df.columns and "consumption_shocked" in df.columns:
-        df["shortfall_abs"] = (
-            pd.to_numeric(df["apparent_consumption"], errors="coerce").fillna(0)
-            - pd.to_numeric(df["consumption_shocked"], errors="coerce").fillna(0)
-        ).clip(lower=0)
+        ac = np.nan_to_num(df["apparent_consumption"].to_numpy(dtype=np.float64, na_value=np.nan))
+        cs = np.nan_to_num(df["consumption_shocked"].to_numpy(dtype=np.float64, na_value=np.nan))
+        np.subtract(ac, cs, out=ac)
+        np.maximum(ac, 0, out=ac)
+        df["shortfall_abs"] = ac
     return df
 
+_SHOCK_FILE_RE = re.compile(r"shock_simulation_latest_importdrop(\d+)\.parquet$")
+
+
+@lru_cache(maxsize=1)
+def _scan_cached_shocks(dir_mtime_ns: int) -> dict[int, Path]:
+    """
+    {shock key (35): path} for the cached shock files in PROCESSED,
+    sorted by shock. Keyed on the directory mtime, so it is rescanned
+    only when files are added, removed or replaced.
+    """
+    # one regex match per file; the parsed key is reused for sorting
+    found = [
+        (int(m.group(1)), p)
+        for p in PROCESSED.glob("shock_simulation_latest_importdrop*.parquet")
+        if (m := _SHOCK_FILE_RE.search(p.name))
+    ]
+    return dict(sorted(found))
+
+
+def _cached_shocks() -> dict[int, Path]:
+    try:
+        dir_mtime_ns = PROCESSED.stat().st_mtime_ns
+    except OSError:
+        return {}
+    return _scan_cached_shocks(dir_mtime_ns)
+
+
 def _shock_to_cached_file(shock_pct: float) -> Path:
     """
     Map shock_pct (0.35) -> shock_simulation_latest_importdrop35.parquet
     Only allows shocks that are actually cached.
     """
     k = int(round(shock_pct * 100)) 
-    path = PROCESSED / f"shock_simulation_latest_importdrop{k}.parquet"
+    path = _cached_shocks().get(k)
 
-    if not path.exists():
+    if path is None:
         raise HTTPException(
             status_code=404,
             detail=(
@@ -100,6 +375,30 @@ def _shock_to_cached_file(shock_pct: float) -> Path:
     return path
 
 
+@lru_cache(maxsize=16)
+def _load_cached_shock(path: Path, mtime_ns: int) -> pd.DataFrame:
+    """
+    Cached shock file ready to serve:
+    special areas removed, shortfall_abs added, ranked by absolute loss first.
+    Keyed on the file's mtime, so a regenerated file is loaded again.
+    Callers filter it but never modify it.
+    """
+    df = _read_parquet(path, _CACHED_COLS)
+    # explicit copy: the columns below are assigned on the filtered frame
+    df = _add_shortfall_abs(_filter_special_areas(df).copy())
+
+    # categorical commodity: the per-request .str.lower() runs over categories only
+    df["commodity"] = df["commodity"].astype("category")
+
+    # files written by the notebook are already in this order; sorting once
+    # at load keeps older, unsorted files correct
+    return df.sort_values(
+        ["shortfall_abs", "risk_score", "apparent_consumption"],
+        ascending=[False, False, False],
+        kind="stable",
+    ).reset_index(drop=True)
+
+
 # Country filters for removing special areas or duplicates
 _DROP_COUNTRY_SUBSTRINGS = [
     ", mainland",
@@ -107,14 +406,35 @@ _DROP_COUNTRY_SUBSTRINGS = [
     "(Kingdom of the)",
 ]
 
+# one case-insensitive scan for all substrings, matched literally
+_DROP_RE = re.compile("|".join(re.escape(s) for s in _DROP_COUNTRY_SUBSTRINGS), re.IGNORECASE)
+
+
 def _filter_special_areas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Rows whose country is not a special area. Returns a slice, not a copy:
+    callers that assign columns on the result copy it first.
+    """
     if "country" not in df.columns:
         return df
-    out = df.copy()
-    mask = pd.Series(False, index=out.index)
-    for s in _DROP_COUNTRY_SUBSTRINGS:
-        mask = mask | out["country"].str.contains(s, case=False, na=False)
-    return out.loc[~mask].copy()
+    mask = df["country"].str.contains(_DROP_RE, na=False)
+    return df.loc[~mask]
+
+
+def _filter_countries(df: pd.DataFrame, region: str | None, countries: str | None) -> pd.DataFrame:
+    """
+    Keep only rows for the requested region and/or comma-separated countries.
+    Applied before ranking so Top-N is taken over the kept rows only.
+    """
+    if region and region != "All":
+        df = df[df["country"].isin(REGIONS[region])]
+    if countries:
+        wanted = {c.strip() for c in countries.split(",") if c.strip()}
+        df = df[df["country"].isin(wanted)]
+    return df
+
+
+_REGION_PATTERN = "^(" + "|".join(["All", *REGIONS]) + ")$"
 
 
 # Request model
@@ -141,38 +461,34 @@ def root():
             "simulate": "POST /risk/simulate  {country:'Malta', shock_pct:0.35}",
             "top": "/risk/top?n=20&shock_pct=0.35",
             "top_wheat": "/risk/top?n=20&shock_pct=0.35&commodity=Wheat",
+            "top_africa": "/risk/top?n=20&shock_pct=0.35&region=Africa",
         },
     }
 
 
 @app.get("/risk/country/{country}")
-def risk_by_country(country: str):
-    risk, base, sim = _load_all()
+def risk_by_country(
+    request: Request,
+    country: str,
+    orient: str = Query("records", pattern="^(records|columns)$"),
+):
+    data = _load_all()
 
-    risk_c = _filter_special_areas(_country_match(risk, country))
+    risk_c = _filter_special_areas(_country_match(data.risk, country, data.risk_rows))
     if risk_c.empty:
         raise HTTPException(status_code=404, detail=f"No risk data for country='{country}' (after cleaning)")
 
-    base_c_latest = (
-        _filter_special_areas(_country_match(base, country))
-        .sort_values("year")
-        .groupby(["country", "commodity"], as_index=False)
-        .tail(1)
-        .copy()
-    )
-
-    sim_c = _filter_special_areas(_country_match(sim, country))
-
+    # risk_c already holds only this country's cleaned keys
     merged = (
         risk_c
-        .merge(base_c_latest, on=["country", "commodity"], how="left")
+        .merge(data.base_latest_idx, left_on=_KEYS, right_index=True, how="left")
         .merge(
-            sim_c[[
-                "country", "commodity",
+            data.sim_idx[[
                 "shortfall_pct", "consumption_shocked",
                 "flag_zero_consumption_after_shock"
             ]],
-            on=["country", "commodity"],
+            left_on=_KEYS,
+            right_index=True,
             how="left"
         )
     )
@@ -191,49 +507,38 @@ def risk_by_country(country: str):
     ]
     merged = merged[[c for c in cols if c in merged.columns]].sort_values("risk_score", ascending=False)
 
-    records = _round_floats(merged.to_dict(orient="records"), decimals=6)
+    if _wants_arrow(request):
+        return _arrow_response(merged)
 
-    return {
+    return ORJSONResponse({
         "country": merged["country"].iloc[0],
         "n_records": int(len(merged)),
-        "records": records,
+        **_rows_payload(merged, orient),
         "note": "shortfall_* / consumption_shocked come from the precomputed 20% import-drop simulation file.",
-    }
+    })
 
 
 @app.post("/risk/simulate")
 def simulate_risk(req: SimulationRequest):
-    risk, base, _sim = _load_all()
+    data = _load_all()
     country = req.country.strip()
 
-    base_c = _filter_special_areas(_country_match(base, country))
-    if base_c.empty:
+    latest_base = _filter_special_areas(_country_match(data.base_latest, country, data.base_latest_rows))
+    if latest_base.empty:
         raise HTTPException(status_code=404, detail=f"No base data for country='{country}' (after cleaning)")
 
-    latest_base = (
-        base_c.sort_values("year")
-              .groupby(["country", "commodity"], as_index=False)
-              .tail(1)
-              .copy()
-    )
-
     sim = simulate_import_shock(latest_base, shock_pct=req.shock_pct)
     sim["flag_zero_consumption_after_shock"] = sim["consumption_shocked"].eq(0)
 
     if "shortfall_abs" not in sim.columns:
         sim = _add_shortfall_abs(sim)
 
-    risk_c = _filter_special_areas(_country_match(risk, country))
-    if risk_c.empty:
-        risk_c = pd.DataFrame(columns=[
-            "country", "commodity", "risk_score", "risk_band",
-            "mean_idr", "prod_vol_norm", "import_vol_norm"
-        ])
-
+    # sim rows are this country's cleaned keys; missing risk rows stay NaN
     merged = (
         sim.merge(
-            risk_c[["country", "commodity", "risk_score", "risk_band", "mean_idr", "prod_vol_norm", "import_vol_norm"]],
-            on=["country", "commodity"],
+            data.risk_idx[["risk_score", "risk_band", "mean_idr", "prod_vol_norm", "import_vol_norm"]],
+            left_on=_KEYS,
+            right_index=True,
             how="left"
         )
     ).sort_values(["shortfall_abs", "risk_score"], ascending=[False, False])
@@ -251,38 +556,41 @@ def simulate_risk(req: SimulationRequest):
     ]
     merged = merged[[c for c in cols if c in merged.columns]]
 
-    records = _round_floats(merged.to_dict(orient="records"), decimals=6)
+    records = _records(merged, decimals=6)
 
-    return {
+    return ORJSONResponse({
         "country": country,
         "shock_pct": round(float(req.shock_pct), 6),
         "n_records": int(len(records)),
         "records": records,
         "note": "This simulation is computed live from latest base-year data per commodity.",
-    }
+    })
 
 
 @app.get("/risk/top")
 def top_risk(
+    request: Request,
     n: int = Query(20, ge=1, le=200),
     shock_pct: float = Query(0.20, ge=0.0, le=1.0),
-    commodity: str | None = Query(default=None)
+    commodity: str | None = Query(default=None),
+    region: str | None = Query(default=None, pattern=_REGION_PATTERN),
+    countries: str | None = Query(default=None, description="Comma-separated country names"),
+    orient: str = Query("records", pattern="^(records|columns)$"),
 ):
     print(">>> RUNNING NEW /risk/top (shock ranking by ABS shortfall) <<<")
 
-    risk, base, _ = _load_all()
-
-    latest_base = (
-        base.sort_values("year")
-            .groupby(["country", "commodity"], as_index=False)
-            .tail(1)
-            .copy()
-    )
+    data = _load_all()
+    risk = data.risk
+    latest_base = data.base_latest
 
     if commodity:
         latest_base = latest_base[latest_base["commodity"].str.lower() == commodity.lower()].copy()
         risk = risk[risk["commodity"].str.lower() == commodity.lower()].copy()
 
+    # region / country filter before ranking
+    latest_base = _filter_countries(latest_base, region, countries)
+    risk = _filter_countries(risk, region, countries)
+
     # clean before checking empties
     latest_base = _filter_special_areas(latest_base)
     risk = _filter_special_areas(risk)
@@ -304,15 +612,19 @@ def top_risk(
         "flag_zero_consumption_after_shock"
     ]
 
+    # latest_base was filtered on key columns only, so joining the indexed
+    # snapshot on risk's (equally filtered) keys gives the same rows
     merged = (
-        risk.merge(latest_base, on=["country", "commodity"], how="inner")
-            .merge(sim_live[sim_keep], on=["country", "commodity"], how="left")
+        risk.merge(data.base_latest_idx, left_on=_KEYS, right_index=True, how="inner")
+            .merge(sim_live[sim_keep], on=_KEYS, how="left")
     )
 
-    # absolute loss first
+    # absolute loss first (NaN keys last). Not nlargest: with several keys it
+    # can return more than n rows, or raise, when a key is NaN.
     merged = merged.sort_values(
         ["shortfall_abs", "risk_score", "apparent_consumption"],
-        ascending=[False, False, False]
+        ascending=[False, False, False],
+        na_position="last",
     ).head(n)
 
     cols = [
@@ -328,129 +640,102 @@ def top_risk(
     ]
     merged = merged[[c for c in cols if c in merged.columns]]
 
-    records = _round_floats(merged.to_dict(orient="records"), decimals=6)
+    if _wants_arrow(request):
+        return _arrow_response(merged)
 
-    return {
+    return ORJSONResponse({
         "handler": "NEW_SHOCK_TOP_v2_ABS",
         "shock_pct": round(float(shock_pct), 6),
         "commodity": commodity,
-        "n_records": int(len(records)),
-        "records": records,
+        "region": region,
+        "n_records": int(len(merged)),
+        **_rows_payload(merged, orient),
         "note": "Ranked by shortfall_abs DESC, then risk_score DESC, then apparent_consumption DESC (simulation computed live)."
-    }
+    })
 
 
 @app.get("/risk/top_cached")
 def top_risk_cached(
+    request: Request,
     n: int = Query(20, ge=1, le=200),
     shock_pct: float = Query(0.35, ge=0.0, le=1.0),
     commodity: str | None = Query(default=None),
+    region: str | None = Query(default=None, pattern=_REGION_PATTERN),
+    countries: str | None = Query(default=None, description="Comma-separated country names"),
+    orient: str = Query("records", pattern="^(records|columns)$"),
 ):
     """
     Cached ranking endpoint.
     Loads precomputed parquet for the requested shock_pct (must exist).
-    Supports optional commodity filter.
+    Supports optional commodity, region and countries filters.
+    orient=columns returns {"columns": {col: [...]}} instead of "records".
+    Accept: application/vnd.apache.arrow.stream returns the rows as Arrow IPC.
     """
     cached_path = _shock_to_cached_file(shock_pct)
 
-    df = pd.read_parquet(cached_path)
+    # cleaned, with shortfall_abs, already ranked
+    df = _load_cached_shock(cached_path, cached_path.stat().st_mtime_ns)
 
     # commodity filter
     if commodity:
-        df = df[df["commodity"].str.lower() == commodity.lower()].copy()
+        df = df[df["commodity"].str.lower() == commodity.lower()]
+
+    # region / country filter
+    df = _filter_countries(df, region, countries)
 
     if df.empty:
         raise HTTPException(status_code=404, detail="No rows match your filters.")
 
-    # ensure special areas filtered out
-    df = _filter_special_areas(df)
-
-    # Ensure shortfall_abs exists
-    df = _add_shortfall_abs(df)
+    # filters keep the ranked order, so Top-N is just the head
+    df = df.head(n)
+    df = df[[c for c in _CACHED_COLS if c in df.columns]]
 
-    # Sort absolute loss first
-    df = df.sort_values(
-        ["shortfall_abs", "risk_score", "apparent_consumption"],
-        ascending=[False, False, False],
-    ).head(n)
+    if _wants_arrow(request):
+        return _arrow_response(df)
 
-    cols = [
-        "country", "commodity",
-        "risk_score", "risk_band",
-        "mean_idr", "prod_vol_norm", "import_vol_norm",
-        "year",
-        "production_qty", "import_qty", "export_qty",
-        "apparent_consumption", "import_dependency_ratio",
-        "shortfall_pct", "shortfall_abs",
-        "consumption_shocked", "idr_shocked",
-        "flag_zero_consumption_after_shock",
-    ]
-    df = df[[c for c in cols if c in df.columns]]
-
-    records = _round_floats(df.to_dict(orient="records"), decimals=6)
-
-    return {
+    return ORJSONResponse({
         "handler": "CACHED_TOP_v2_AUTO",
         "shock_pct": round(float(shock_pct), 6),
         "commodity": commodity,
-        "n_records": int(len(records)),
-        "records": records,
+        "region": region,
+        "n_records": int(len(df)),
+        **_rows_payload(df, orient),
         "note": f"Loaded from cached file: {cached_path.name} (precomputed).",
-    }
+    })
 
 
 @app.get("/meta/commodities")
-def list_commodities():
-    risk, _, _ = _load_all()
-    items = sorted(risk["commodity"].dropna().unique().tolist())
-    return {"n": len(items), "commodities": items}
+def list_commodities(request: Request):
+    items = _load_all().commodities
+    return _etag_json(request, {"n": len(items), "commodities": items})
 
 
 @app.get("/meta/countries")
-def list_countries(q: str | None = None):
-    risk, _, _ = _load_all()
-    countries = risk["country"].dropna().unique().tolist()
-
-    # hide special areas in search results
-    countries_df = pd.DataFrame({"country": countries})
-    countries_df = _filter_special_areas(countries_df)
-    countries = countries_df["country"].tolist()
+def list_countries(request: Request, q: str | None = None):
+    country_list = _load_all().countries
 
+    # sorted once at load, special areas already hidden
     if q:
         ql = q.strip().lower()
-        countries = [c for c in countries if ql in c.lower()]
+        countries = [c for c, lc in country_list if ql in lc]
+    else:
+        countries = [c for c, _ in country_list]
 
-    countries = sorted(countries)
-    return {"n": len(countries), "countries": countries[:200]}
+    return _etag_json(request, {"n": len(countries), "countries": countries[:200]})
 
 
 @app.get("/meta/shocks_cached")
-def list_cached_shocks():
+def list_cached_shocks(request: Request):
     """
     Lists which precomputed shock parquet files exist in /data/processed.
     Example files:
       shock_simulation_latest_importdrop10.parquet
       shock_simulation_latest_importdrop35.parquet
     """
-    pattern = re.compile(r"shock_simulation_latest_importdrop(\d+)\.parquet$")
+    shocks = _cached_shocks()
 
-    files = []
-    shocks = []
-
-    for p in PROCESSED.glob("shock_simulation_latest_importdrop*.parquet"):
-        m = pattern.search(p.name)
-        if not m:
-            continue
-        k = int(m.group(1))          
-        shocks.append(k / 100.0)   
-        files.append(p.name)
-
-    # sort by shock size
-    shocks_sorted = sorted(shocks)
-    files_sorted = sorted(files, key=lambda name: int(pattern.search(name).group(1)))
-
-    return {
-        "n": len(shocks_sorted),
-        "shocks": shocks_sorted,
-        "files": files_sorted
-    }
\ No newline at end of file
+    return _etag_json(request, {
+        "n": len(shocks),
+        "shocks": [k / 100.0 for k in shocks],
+        "files": [p.name for p in shocks.values()]
+    })
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
-import io
 import zipfile
 from pathlib import Path
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
 import requests
 
 from src.config import (
@@ -67,17 +69,34 @@ def find_main_csv(zf: zipfile.ZipFile) -> str:
 
 
 # Read zip CSV in chunks & filter early
+# Only these FAOSTAT columns are used downstream. Text columns are read as raw
+# bytes so filtering never needs them decoded, only the kept rows get decoded.
+CSV_COLUMN_TYPES = {
+    "Area Code": pa.int64(),
+    "Area": pa.binary(),
+    "Item Code": pa.int64(),
+    "Item": pa.binary(),
+    "Element": pa.binary(),
+    "Year": pa.int64(),
+    "Value": pa.float64(),
+}
+CSV_TEXT_COLUMNS = ["Area", "Item", "Element"]
+
+
 def read_filtered_chunks(zip_path: Path, keep_elements: list[str]) -> pd.DataFrame:
     """
-    Reads the big normalized FAOSTAT CSV inside the zip in chunks.
+    Streams the big normalized FAOSTAT CSV inside the zip through
+    PyArrow's CSV reader, one block at a time.
 
-    For each chunk, we filter:
+    For each block, we filter (with Arrow compute kernels):
       - Year range
       - Item in COMMODITIES
       - Element in keep_elements
 
-    Then we append only the filtered rows.
+    Then we keep only the filtered rows, and convert them to pandas once.
     """
+    items = pa.array([c.encode("utf-8") for c in COMMODITIES], type=pa.binary())
+    elements = pa.array([e.encode("utf-8") for e in keep_elements], type=pa.binary())
     collected = []
 
     with zipfile.ZipFile(zip_path, "r") as zf:
@@ -85,25 +104,39 @@ def read_filtered_chunks(zip_path: Path, keep_elements: list[str]) -> pd.DataFra
         print(f"[READ] {zip_path.name} -> {csv_name}")
 
         with zf.open(csv_name) as f:
-            text = io.TextIOWrapper(f, encoding="utf-8", errors="replace")
-
-            for chunk in pd.read_csv(text, chunksize=300_000):
-                # filter years
-                chunk = chunk[(chunk["Year"] >= START_YEAR) & (chunk["Year"] <= END_YEAR)]
-
-                # filter commodities
-                chunk = chunk[chunk["Item"].isin(COMMODITIES)]
-
-                # filter elements (Production, Import Quantity, Export Quantity)
-                chunk = chunk[chunk["Element"].isin(keep_elements)]
-
-                if not chunk.empty:
-                    collected.append(chunk)
+            reader = pacsv.open_csv(
+                f,
+                read_options=pacsv.ReadOptions(block_size=64 << 20),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=CSV_COLUMN_TYPES,
+                    include_columns=list(CSV_COLUMN_TYPES),
+                    strings_can_be_null=True,
+                ),
+            )
+
+            for batch in reader:
+                year = batch.column("Year")
+                mask = pc.and_(
+                    # filter years
+                    pc.and_(pc.greater_equal(year, START_YEAR), pc.less_equal(year, END_YEAR)),
+                    # filter commodities and elements (Production, Import Quantity, Export Quantity)
+                    pc.and_(
+                        pc.is_in(batch.column("Item"), value_set=items),
+                        pc.is_in(batch.column("Element"), value_set=elements),
+                    ),
+                )
+                batch = batch.filter(mask)
+
+                if batch.num_rows:
+                    collected.append(batch)
 
     if not collected:
         return pd.DataFrame()
 
-    return pd.concat(collected, ignore_index=True)
+    df = pa.Table.from_batches(collected).to_pandas()
+    for c in CSV_TEXT_COLUMNS:
+        df[c] = df[c].str.decode("utf-8", errors="replace")
+    return df
 
 
 # Production pipeline
@@ -157,14 +190,15 @@ def fetch_trade() -> pd.DataFrame:
         }
     )
 
-    # Convert long to wide, one column for imports, one for exports
+    # Convert long to wide, one column for imports, one for exports.
+    # If missing, treat as 0 (fill_value does it during the unstack)
     pivot = (
-        df.pivot_table(
-            index=["country", "country_code", "commodity", "commodity_code", "year"],
-            columns="element",
-            values="trade_qty",
-            aggfunc="sum",
-        )
+        df.groupby(
+            ["country", "country_code", "commodity", "commodity_code", "year", "element"],
+            observed=True,
+        )["trade_qty"]
+        .sum()
+        .unstack("element", fill_value=0)
         .reset_index()
     )
     pivot = pivot.rename(
@@ -174,11 +208,6 @@ def fetch_trade() -> pd.DataFrame:
         }
     )
 
-
-    # If missing, treat as 0
-    pivot["import_qty"] = pivot["import_qty"].fillna(0)
-    pivot["export_qty"] = pivot["export_qty"].fillna(0)
-
     return pivot
 
 
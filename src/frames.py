@@ -0,0 +1,25 @@
+import numpy as np
+import pandas as pd
+
+
+def downcast_frame(df: pd.DataFrame, numeric_cols=(), keep_float64=()) -> pd.DataFrame:
+    """
+    Narrow dtypes of a freshly loaded frame, in place:
+      - numeric_cols that a file stores as text are coerced to numbers (once, here)
+      - float64 columns become float32, except those in keep_float64
+      - int64 columns become the smallest integer type that fits
+
+    float32 holds ~7 significant digits: fine for values shown rounded to a few
+    decimals, not for tonnes (1e8 is off by several units) or for differences
+    of tonnes, which cancel most of those digits. Keep those in keep_float64.
+    """
+    text_nums = [c for c in numeric_cols if c in df.columns and not pd.api.types.is_numeric_dtype(df[c])]
+    if text_nums:
+        df[text_nums] = df[text_nums].apply(pd.to_numeric, errors="coerce")
+
+    # float32 / small ints: half the bytes through every merge, sort and groupby
+    for c in df.select_dtypes("float64").columns.difference(list(keep_float64)):
+        df[c] = df[c].astype(np.float32)
+    for c in df.select_dtypes("int64").columns:
+        df[c] = pd.to_numeric(df[c], downcast="integer")
+    return df
@@ -0,0 +1,14 @@
+# Region lists (simple), shared by the dashboard and the API
+AFRICA = frozenset({
+    "Nigeria", "Egypt", "Algeria", "Morocco", "Tunisia", "Kenya", "Ethiopia",
+    "Ghana", "Senegal", "South Africa"
+})
+EU = frozenset({
+    "Germany", "France", "Italy", "Spain", "Netherlands", "Belgium",
+    "Poland", "Portugal", "Greece", "Austria", "Sweden", "Finland"
+})
+
+REGIONS = {
+    "Africa": AFRICA,
+    "EU": EU,
+}
@@ -29,34 +29,44 @@ def simulate_import_shock(latest_base: pd.DataFrame, shock_pct: float = 0.20) ->
     df["apparent_consumption"] = pd.to_numeric(df["apparent_consumption"], errors="coerce").fillna(0).clip(lower=0)
     df["import_qty"] = pd.to_numeric(df["import_qty"], errors="coerce").fillna(0).clip(lower=0)
 
-    C = df["apparent_consumption"]
-    imp = df["import_qty"]
+    # Core math on raw float64 arrays: no Series temporaries or index alignment per step
+    C = df["apparent_consumption"].to_numpy(dtype=np.float64)
+    imp = df["import_qty"].to_numpy(dtype=np.float64)
 
     # Flag weird data situations
-    df["flag_imports_exceed_consumption"] = imp.gt(C)
+    df["flag_imports_exceed_consumption"] = np.greater(imp, C)
 
     # Only imports that can be "inside" consumption
-    df["imports_used"] = np.minimum(imp, C)
+    imports_used = np.minimum(imp, C)
+    df["imports_used"] = imports_used
 
     # Imports after shock (only used portion is shocked)
-    df["imports_shocked"] = df["imports_used"] * (1 - shock_pct)
+    imports_shocked = imports_used * (1 - shock_pct)
+    df["imports_shocked"] = imports_shocked
 
     # Consumption after shock
-    df["consumption_shocked"] = (C - shock_pct * df["imports_used"]).clip(lower=0)
+    consumption_shocked = C - shock_pct * imports_used
+    np.maximum(consumption_shocked, 0, out=consumption_shocked)
+    df["consumption_shocked"] = consumption_shocked
 
     # Shortfall (absolute + percent)
-    df["shortfall_abs"] = (C - df["consumption_shocked"]).clip(lower=0)
-    df["shortfall_pct"] = np.where(C > 0, df["shortfall_abs"] / C, np.nan)
+    shortfall_abs = C - consumption_shocked
+    np.maximum(shortfall_abs, 0, out=shortfall_abs)
+    df["shortfall_abs"] = shortfall_abs
 
-    # Import dependency after shock (raw,  clipped)
-    df["idr_shocked_raw"] = np.where(
-        df["consumption_shocked"] > 0,
-        df["imports_shocked"] / df["consumption_shocked"],
-        np.nan
-    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["shortfall_pct"] = np.where(C > 0, shortfall_abs / C, np.nan)
 
-    df["flag_idr_over_1"] = df["idr_shocked_raw"].gt(1)
+        # Import dependency after shock (raw,  clipped)
+        idr_shocked_raw = np.where(
+            consumption_shocked > 0,
+            imports_shocked / consumption_shocked,
+            np.nan
+        )
+    df["idr_shocked_raw"] = idr_shocked_raw
 
-    df["idr_shocked"] = df["idr_shocked_raw"].clip(0, 1)
+    df["flag_idr_over_1"] = np.greater(idr_shocked_raw, 1)
+
+    df["idr_shocked"] = np.clip(idr_shocked_raw, 0, 1)
 
     return df